@@ -1,8 +1,7 @@
-from venv import logger
-from result import Ok,Err, Result
+from result import Ok,Err, Result, OK_TRUE
 from loguru import logger
 
 def callback(client, userdata, msg) -> Result[bool, str]:
-    logger.info("true callback")
-    logger.info(f"Received message: {msg.payload.decode()} on topic {msg.topic}")
-    return Ok(True)
+    logger.debug("true callback")
+    logger.debug("Received message on topic {} size {}", msg.topic, len(msg.payload))
+    return OK_TRUE
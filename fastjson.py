@@ -0,0 +1,10 @@
+"""JSON 解析/序列化：优先使用 orjson，未安装时回退到标准库 json
+
+orjson.dumps 返回 bytes，json.dumps 返回 str，两者都可以直接作为 MQTT payload 发布。
+"""
+try:
+    from orjson import dumps, loads
+except ImportError:
+    from json import dumps, loads
+
+__all__ = ["dumps", "loads"]
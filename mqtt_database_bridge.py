@@ -1,37 +1,219 @@
+"""MQTT -> 数据库桥接：按 config.json 订阅 Topic，并将消息交给对应的 Callback 脚本处理
+
+config.json 顶层配置：
+    broker / port      MQTT Broker 地址，默认 127.0.0.1:1883
+    interval           主循环最长等待时间（秒），默认 5；配置或 Callback 文件变更时立即唤醒
+    workers            执行 Callback 的线程数，默认 1，按接收顺序逐条处理；
+                       大于 1 时消息并发执行、不保证顺序，Callback 需自行保证线程安全
+    max_pending        线程池中排队/执行中的任务上限，默认 1000，超过后丢弃新消息
+    topics             {topic: Topic 配置}
+
+Topic 配置：
+    callback_path      Callback 脚本路径（必填）
+    qos                订阅 QoS，默认 0
+    batch_size         设置后启用批处理，缓冲的消息达到该条数时立即处理
+    batch_window_ms    批处理窗口（毫秒），默认 100，窗口到期时处理已缓冲的消息
+
+Callback 脚本中可定义的函数，返回值均为 Result[bool, str]：
+    callback(client, userdata, msg)               必须定义
+    callback_json(client, userdata, msg, data)    可选，定义后代替 callback() 处理单条消息，
+                                                  data 为桥接解析好的 JSON payload
+    callback_batch(client, userdata, batch)       可选，批处理 Topic 每批调用一次，batch 为消息列表
+"""
 import paho.mqtt.client as mqtt
-import json
+import hashlib
+import re
+import socket
+import sys
+import threading
 import time
 import os
 import importlib.util
-from typing import Dict, Callable
-from result import Result, Ok, Err
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Callable, Optional
+from result import Result, Ok, Err, OK_TRUE
+from fastjson import loads as json_loads
 from loguru import logger
+from watchdog.observers import Observer
+from watchdog.events import FileSystemEventHandler
 import inspect
 import typing
 from typing import Any, Callable, get_origin, get_args
 
+try:
+    import simdjson
+except ImportError:
+    simdjson = None
+
+# 超过该字节数的 payload 使用 simdjson 解析，较小的 payload 使用 orjson
+SIMDJSON_THRESHOLD = 4096
+# 线程池中排队/执行中的消息上限，超过后丢弃新消息
+MAX_PENDING = 1000
+# 未配置 batch_window_ms 时的默认批处理窗口
+DEFAULT_BATCH_WINDOW_MS = 100
+
 
 def callback(client, userdata, msg) -> Result[bool, str]:
     """默认的 Callback 函数，用于处理 MQTT 消息"""
     logger.warning(
-        f"Default callback received message: {msg.payload.decode()} on topic {msg.topic}"
+        "Default callback received message on topic {} size {}",
+        msg.topic,
+        len(msg.payload),
     )
-    return Ok(True)
+    return OK_TRUE
+
+
+# 加载失败时使用的缓存项：(callback, mtime, callback_batch, callback_json)
+DEFAULT_CALLBACK_ENTRY = (callback, None, None, None)
+
+
+class _FileChangeHandler(FileSystemEventHandler):
+    """文件变更通知：将配置文件或 Callback 文件标记为 dirty"""
+
+    def __init__(self, bridge: "MQTTDatabaseBridge"):
+        self.bridge = bridge
+
+    def on_modified(self, event):
+        self.bridge._mark_dirty(event.src_path)
+
+    def on_created(self, event):
+        self.bridge._mark_dirty(event.src_path)
+
+    def on_moved(self, event):
+        # 编辑器通常以 "写临时文件 + 重命名" 的方式保存
+        self.bridge._mark_dirty(event.dest_path)
+
+
+class _TopicBatch:
+    """单个 Topic 的批处理缓冲区
+
+    在 Topic 配置中设置 batch_size（以及可选的 batch_window_ms）后启用：
+    缓冲区满或窗口到期时一次性处理所有消息。若 Callback 模块定义了
+    callback_batch(client, userdata, batch)，则整批调用一次，否则逐条调用 callback()。
+    """
+
+    def __init__(self, topic: str):
+        self.topic = topic
+        self.callback_path = None
+        self.size = 1
+        self.window = DEFAULT_BATCH_WINDOW_MS / 1000
+        self.callback_batch = None
+        self.dispatch = None  # 未定义 callback_batch 时逐条处理消息的函数
+        self.messages = deque()
+        self.lock = threading.Lock()
+        self.timer = None
+
+    def drain(self) -> list:
+        """取出所有缓冲的消息并取消定时器，调用方需持有 lock"""
+        items = list(self.messages)
+        self.messages.clear()
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        return items
 
 
 class MQTTDatabaseBridge:
     def __init__(self, config_path: str = "config.json"):
         self.config_path = config_path
         self.config = self._load_config()
-        self.last_config_mtime = os.path.getmtime(config_path)
-        self.callback_cache = {}  # 缓存 Handler 函数和最后修改时间：{handler_path: (func, mtime)}
+        self.callback_cache = {}  # 缓存 Handler 函数和最后修改时间：{handler_path: (func, mtime, batch_func, json_func)}
         self.subscribed_topics = set()
+        self._topic_batches: Dict[str, _TopicBatch] = {}  # 配置了 batch_size 的 Topic
+        # simdjson Parser 不是线程安全的，每个工作线程复用自己的 Parser
+        self._local = threading.local()
+        # 由 watchdog 线程置位，消息处理路径上不再调用 getmtime
+        self._config_abspath = os.path.abspath(config_path)
+        self._config_dirty = False
+        self._callback_dirty: Dict[str, bool] = {}  # {callback_path: dirty}
+        # {abs_path: (callback_path, ...)}，整体替换而非原地修改，watchdog 线程可安全遍历
+        self._watched_callbacks: Dict[str, tuple] = {}
+        self._active_callback_paths = set()  # 当前配置中使用的 callback_path
+        self._watched_dirs = set()
+        self._wake = threading.Event()  # 文件变更时唤醒主循环
+        self._file_handler = _FileChangeHandler(self)
+        self._observer = Observer()
+        self._watch_dir(os.path.dirname(self._config_abspath))
+        self._observer.start()
+        # Callback 在线程池中执行，paho 网络线程收到消息后立即返回。
+        # 默认单线程，与在网络线程中执行时一样按接收顺序逐条处理；
+        # workers > 1 时消息并发执行、不保证顺序，Callback 需自行保证线程安全
+        self._pool = ThreadPoolExecutor(
+            max_workers=self.config.get("workers", 1),
+            thread_name_prefix="callback",
+        )
+        self._pending = threading.BoundedSemaphore(
+            self.config.get("max_pending", MAX_PENDING)
+        )
         self.client = self._init_client()
 
     def _load_config(self) -> Dict:
         """加载配置文件"""
-        with open(self.config_path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        with open(self.config_path, "rb") as f:
+            config = json_loads(f.read())
+        if not isinstance(config, dict) or not isinstance(config.get("topics", {}), dict):
+            raise ValueError("配置文件格式错误：顶层和 topics 必须是对象")
+        return config
+
+    def _watch_dir(self, directory: str):
+        """监听目录下的文件变更"""
+        if directory not in self._watched_dirs:
+            self._observer.schedule(self._file_handler, directory, recursive=False)
+            self._watched_dirs.add(directory)
+
+    def _watch_callback(self, callback_path: str):
+        """监听 Callback 文件的变更"""
+        abs_path = os.path.abspath(callback_path)
+        callback_paths = self._watched_callbacks.get(abs_path, ())
+        if callback_path not in callback_paths:
+            self._watch_dir(os.path.dirname(abs_path))
+            self._watched_callbacks[abs_path] = callback_paths + (callback_path,)
+
+    def _unwatch_callback(self, callback_path: str):
+        """不再使用的 Callback：移除监听记录、dirty 标记和缓存"""
+        abs_path = os.path.abspath(callback_path)
+        callback_paths = tuple(
+            path
+            for path in self._watched_callbacks.get(abs_path, ())
+            if path != callback_path
+        )
+        if callback_paths:
+            self._watched_callbacks[abs_path] = callback_paths
+        else:
+            self._watched_callbacks.pop(abs_path, None)
+        self._callback_dirty.pop(callback_path, None)
+        self.callback_cache.pop(callback_path, None)
+
+    def _mark_dirty(self, path):
+        """文件变更回调（watchdog 线程）：标记配置文件或 Callback 需要重新加载"""
+        abs_path = os.path.abspath(os.fsdecode(path))
+        if abs_path == self._config_abspath:
+            self._config_dirty = True
+            self._wake.set()
+        callback_paths = self._watched_callbacks.get(abs_path, ())
+        for callback_path in callback_paths:
+            self._callback_dirty[callback_path] = True
+        if callback_paths:
+            self._wake.set()
+
+    def _parse(self, payload: bytes) -> Any:
+        """解析 JSON payload，大 payload 复用当前线程的 simdjson Parser 以避免重复分配
+
+        simdjson 返回的代理对象只在下一次 parse() 之前有效，
+        因此这里总是转换为普通的 dict/list 后再返回。
+        """
+        if simdjson is not None and len(payload) >= SIMDJSON_THRESHOLD:
+            parser = getattr(self._local, "sjparser", None)
+            if parser is None:
+                parser = self._local.sjparser = simdjson.Parser()
+            doc = parser.parse(payload)
+            if isinstance(doc, simdjson.Object):
+                return doc.as_dict()
+            if isinstance(doc, simdjson.Array):
+                return doc.as_list()
+            return doc
+        return json_loads(payload)
 
     def _default_callback(self) -> Callable:
         """返回默认的 Callback 函数"""
@@ -42,13 +224,51 @@ class MQTTDatabaseBridge:
         client = mqtt.Client(
             mqtt.CallbackAPIVersion.VERSION2, "python-mqtt-database-bridge"
         )
-        client.on_message = self._on_message
+        client.on_socket_open = self._on_socket_open  # 需在 connect 之前设置
         broker = self.config.get("broker", "127.0.0.1")
         port = self.config.get("port", 1883)
         client.connect(broker, port, 60)
         client.loop_start()
         return client
 
+    def _on_socket_open(self, client, userdata, sock):
+        """连接建立时关闭 Nagle 算法，PUBACK 等小包不在内核中等待合并"""
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        except (AttributeError, OSError) as e:  # 如 WebSocket 包装的 socket
+            logger.warning(f"设置 TCP_NODELAY 失败: {e}")
+
+    def _validate_topic_config(self, topic: str, cfg) -> bool:
+        """验证单个 Topic 的配置是否正确"""
+        if not isinstance(cfg, dict):
+            logger.warning(f"Topic {topic} 配置错误：期望对象，实际 {cfg!r}，跳过该 Topic")
+            return False
+        callback_path = cfg.get("callback_path")
+        if not isinstance(callback_path, str) or not callback_path:
+            logger.warning(f"Topic {topic} 缺少 callback_path，跳过该 Topic")
+            return False
+        qos = cfg.get("qos", 0)
+        if isinstance(qos, bool) or qos not in (0, 1, 2):
+            logger.warning(f"Topic {topic} qos 错误：期望 0/1/2，实际 {qos!r}，跳过该 Topic")
+            return False
+        batch_size = cfg.get("batch_size", 0)
+        if isinstance(batch_size, bool) or not isinstance(batch_size, int) or batch_size < 0:
+            logger.warning(
+                f"Topic {topic} batch_size 错误：期望非负整数，实际 {batch_size!r}，跳过该 Topic"
+            )
+            return False
+        batch_window_ms = cfg.get("batch_window_ms", DEFAULT_BATCH_WINDOW_MS)
+        if (
+            isinstance(batch_window_ms, bool)
+            or not isinstance(batch_window_ms, (int, float))
+            or batch_window_ms <= 0
+        ):
+            logger.warning(
+                f"Topic {topic} batch_window_ms 错误：期望正数，实际 {batch_window_ms!r}，跳过该 Topic"
+            )
+            return False
+        return True
+
     def _validate_callback_signature(self, module) -> bool:
         """验证 Callback 函数签名是否正确"""
         # 1. 检查模块是否有 callback 属性
@@ -60,20 +280,33 @@ class MQTTDatabaseBridge:
         if not inspect.isfunction(func):
             logger.warning(f"Callback 不是函数 {module}")
             return False
-        # 3. 检查参数名称是否正确
-        sig = inspect.signature(func)
-        expected_params = ["client", "userdata", "msg"]
-        actual_params = list(sig.parameters.keys())
+        return self._validate_function_signature(func, ["client", "userdata", "msg"])
+
+    def _validate_function_signature(self, func, expected_params: list) -> bool:
+        """验证函数参数及返回值类型 Result[bool, str]"""
+        # 与 inspect.signature 一致，functools.wraps 装饰的函数按被包装的原函数验证
+        func = inspect.unwrap(func)
+        # 3. 检查参数名称是否正确（直接读取 __code__，避免构造 inspect.Signature）
+        code = func.__code__
+        argcount, kwonlycount = code.co_argcount, code.co_kwonlyargcount
+        actual_params = list(code.co_varnames[:argcount])
+        extra_index = argcount + kwonlycount
+        if code.co_flags & inspect.CO_VARARGS:
+            actual_params.append("*" + code.co_varnames[extra_index])
+            extra_index += 1
+        actual_params.extend(code.co_varnames[argcount : argcount + kwonlycount])
+        if code.co_flags & inspect.CO_VARKEYWORDS:
+            actual_params.append("**" + code.co_varnames[extra_index])
         if actual_params != expected_params:
             logger.warning(f"参数不匹配：期望 {expected_params}，实际 {actual_params}")
             return False
         # 4. 检查所有参数是否没有默认值
-        for param in sig.parameters.values():
-            if param.default is not inspect.Parameter.empty:
-                logger.warning(f"参数 {param.name} 不能有默认值")
-                return False
+        if func.__defaults__:
+            name = actual_params[argcount - len(func.__defaults__)]
+            logger.warning(f"参数 {name} 不能有默认值")
+            return False
         # 5. 检查返回值是否为 Union 类型
-        return_annotation = sig.return_annotation
+        return_annotation = func.__annotations__.get("return")
         origin = get_origin(return_annotation)
         if origin is not typing.Union:
             logger.warning(f"返回值类型错误：期望 {typing.Union}，实际 {origin}")
@@ -106,107 +339,328 @@ class MQTTDatabaseBridge:
             return False
         return True
 
-    def _load_callback(self, callback_path: str) -> Callable:
-        """动态导入 Callback 脚本中的 callback() 函数"""
-        # 检查 Callback 文件是否更新
-        current_mtime = os.path.getmtime(callback_path)
+    def _load_callback(self, callback_path: str) -> tuple:
+        """动态导入 Callback 脚本，返回 (callback, mtime, callback_batch, callback_json)"""
+        # 已缓存且文件未被标记为变更时直接返回，不做任何系统调用
         cached = self.callback_cache.get(callback_path)
+        if cached and not self._callback_dirty.get(callback_path):
+            return cached
+
+        # 检查 Callback 文件是否更新
+        self._callback_dirty[callback_path] = False
+        try:
+            self._watch_callback(callback_path)
+            current_mtime = os.path.getmtime(callback_path)
+        except OSError as e:
+            # Callback 映射在主循环中刷新，文件或目录缺失时不能让异常中断主循环；
+            # 目录不存在时无法监听，保持 dirty，由主循环在每个检查间隔重试
+            if callback_path not in self._watched_callbacks.get(
+                os.path.abspath(callback_path), ()
+            ):
+                self._callback_dirty[callback_path] = True
+            logger.warning(f"读取 Callback 文件失败 {callback_path}: {e}")
+            logger.warning(f"使用默认 Callback 函数代替 {callback_path}")
+            self.callback_cache.pop(callback_path, None)
+            return DEFAULT_CALLBACK_ENTRY  # 返回默认函数
 
         # 若未缓存或文件已更新，重新导入
         if not cached or current_mtime != cached[1]:
             try:
-                # 动态导入模块
-                spec = importlib.util.spec_from_file_location(
-                    "callback_module", callback_path
-                )
-                module = importlib.util.module_from_spec(spec)
-                spec.loader.exec_module(module)
+                # 动态导入模块：每个 Callback 文件使用独立的模块名，并登记到 sys.modules，
+                # 文件未变更时直接复用已导入的模块
+                module_name = self._callback_module_name(callback_path)
+                module = sys.modules.get(module_name)
+                if module is None or getattr(module, "__mtime__", None) != current_mtime:
+                    spec = importlib.util.spec_from_file_location(
+                        module_name, callback_path
+                    )
+                    module = importlib.util.module_from_spec(spec)
+                    module.__mtime__ = current_mtime
+                    sys.modules[module_name] = module
+                    try:
+                        # SourceFileLoader 按源文件 mtime/大小读写 __pycache__ 中的 .pyc，
+                        # 与模块名无关，未变更的 Callback 重新导入时不会再次编译
+                        spec.loader.exec_module(module)
+                    except BaseException:
+                        del sys.modules[module_name]
+                        raise
                 # 验证 Callback 函数签名
                 if not self._validate_callback_signature(module):
                     logger.warning(f"Callback 函数签名错误 {callback_path}")
                     logger.warning(f"使用默认 Callback 函数代替 {callback_path}")
-                    return callback  # 返回默认函数
+                    self.callback_cache.pop(callback_path, None)
+                    return DEFAULT_CALLBACK_ENTRY  # 返回默认函数
                 # 缓存 Callback 函数和修改时间
-                self.callback_cache[callback_path] = (module.callback, current_mtime)
+                callback_batch = self._load_optional_callback(
+                    module,
+                    "callback_batch",
+                    ["client", "userdata", "batch"],
+                    callback_path,
+                )
+                callback_json = self._load_optional_callback(
+                    module,
+                    "callback_json",
+                    ["client", "userdata", "msg", "data"],
+                    callback_path,
+                )
+                self.callback_cache[callback_path] = (
+                    module.callback,
+                    current_mtime,
+                    callback_batch,
+                    callback_json,
+                )
                 logger.info(f"加载/更新 Callback: {callback_path}")
             except Exception as e:
                 logger.warning(f"导入 Callback 失败 {callback_path}: {e}")
                 logger.warning(f"使用默认 Callback 函数代替 {callback_path}")
-                return callback  # 返回默认函数
+                self.callback_cache.pop(callback_path, None)
+                return DEFAULT_CALLBACK_ENTRY  # 返回默认函数
 
-        return self.callback_cache[callback_path][0]
+        return self.callback_cache[callback_path]
 
-    def _on_message(self, client, userdata, msg):
-        """收到消息时，调用对应的 Callback 处理"""
-        begin_time = time.time()
-        # 从配置获取当前 Topic 的 Callback 路径
-        topic_config = self.config.get("topics", {}).get(msg.topic)
-        if not topic_config:
-            logger.warning(f"未配置 {msg.topic} 的 Callback")
-            return
+    def _callback_module_name(self, callback_path: str) -> str:
+        """Callback 文件的模块名：不含 "." 等字符，避免被导入系统当作包路径解析"""
+        abs_path = os.path.abspath(callback_path)
+        stem = re.sub(r"\W", "_", os.path.splitext(os.path.basename(abs_path))[0])
+        digest = hashlib.sha1(abs_path.encode()).hexdigest()[:12]
+        return f"callback_module_{stem}_{digest}"
+
+    def _load_optional_callback(
+        self, module, name: str, expected_params: list, callback_path: str
+    ) -> Optional[Callable]:
+        """返回模块中可选的 Callback 函数，未定义或签名错误时返回 None"""
+        func = getattr(module, name, None)
+        if func is None:
+            return None
+        if not inspect.isfunction(func) or not self._validate_function_signature(
+            func, expected_params
+        ):
+            logger.warning(f"{name} 函数签名错误 {callback_path}，忽略 {name}")
+            return None
+        return func
+
+    def _make_handler(
+        self, topic: str, dispatch: Callable, batch: Optional[_TopicBatch]
+    ) -> Callable:
+        """生成 Topic 专用的 paho 消息回调（网络线程）：提交到线程池或加入批处理缓冲区"""
+        if batch is not None:
+            enqueue_batch = self._enqueue_batch
+
+            def handler(client, userdata, msg):
+                enqueue_batch(batch, client, userdata, msg)
+
+            return handler
+
+        submit = self._submit
+
+        def handler(client, userdata, msg):
+            if not submit(dispatch, client, userdata, msg):
+                # 返回后 paho 即确认该消息，丢弃意味着该消息不会再被处理
+                logger.warning(f"待处理消息已达上限，丢弃 {topic} 的消息 id {msg.mid}")
+
+        return handler
+
+    def _make_dispatch(
+        self,
+        callback: Callable,
+        callback_json: Optional[Callable],
+        callback_path: str,
+    ) -> Callable:
+        """生成在工作线程中执行的 Topic 专用处理函数，Callback 在生成时固定"""
+        invoke = callback
+        if callback_json is not None:
+            parse = self._parse
+
+            # 定义了 callback_json 的脚本，由桥接解析 payload 后通过 data 参数传入
+            def invoke(client, userdata, msg):
+                return callback_json(client, userdata, msg, parse(msg.payload))
+
+        def dispatch(client, userdata, msg):
+            begin_time = time.perf_counter()
+            try:
+                result: Result[bool, str] = invoke(
+                    client, userdata, msg
+                )  # 调用 Callback 中的 callback()/callback_json() 函数
+                if result.is_ok():
+                    # 成功路径只记录一条 DEBUG 日志，级别未开启时 loguru 不会格式化消息
+                    logger.debug(
+                        "Callback {} 执行成功: Result.value{} 执行耗时: {} 单位: 秒",
+                        callback_path,
+                        result.unwrap(),
+                        time.perf_counter() - begin_time,
+                    )
+                else:
+                    logger.warning(
+                        f"Callback {callback_path} 执行失败: Result Err {result.error}"
+                    )
+            except Exception as e:
+                logger.warning(f"Callback {callback_path} 执行失败: raise error {e!r}")
+
+        return dispatch
 
-        # 加载并执行 Callback
-        callback = self._load_callback(topic_config["callback_path"])
-        if not callback:
-            logger.warning(f"加载 {topic_config['callback_path']} 失败")
+    def _submit(self, fn: Callable, *args) -> bool:
+        """提交任务到线程池，待处理任务达到上限或线程池已关闭时返回 False，由调用方记录日志"""
+        if not self._pending.acquire(blocking=False):
+            return False
+        try:
+            future = self._pool.submit(fn, *args)
+        except RuntimeError:  # 线程池已关闭
+            self._pending.release()
+            return False
+        future.add_done_callback(self._on_task_done)
+        return True
+
+    def _on_task_done(self, future):
+        """线程池任务结束：释放待处理名额，并记录未被处理的异常"""
+        self._pending.release()
+        e = future.exception()
+        if e is not None:
+            logger.opt(exception=e).error(f"线程池任务执行失败: {e!r}")
+
+    def _enqueue_batch(self, batch: _TopicBatch, client, userdata, msg):
+        """将消息加入 Topic 的批处理缓冲区，缓冲区满时立即提交"""
+        with batch.lock:
+            batch.messages.append((client, userdata, msg))
+            if len(batch.messages) < batch.size:
+                # 窗口内的第一条消息启动定时器
+                if batch.timer is None:
+                    batch.timer = threading.Timer(
+                        batch.window, self._flush_batch, (batch,)
+                    )
+                    batch.timer.daemon = True
+                    batch.timer.start()
+                return
+            items = batch.drain()
+        if not self._submit(self._dispatch_batch, batch, items):
+            logger.warning(f"待处理消息已达上限，丢弃 {batch.topic} 的 {len(items)} 条消息")
+
+    def _flush_batch(self, batch: _TopicBatch):
+        """批处理窗口到期（定时器线程）：提交缓冲区中的所有消息"""
+        with batch.lock:
+            items = batch.drain()
+        if items and not self._submit(self._dispatch_batch, batch, items):
+            logger.warning(f"待处理消息已达上限，丢弃 {batch.topic} 的 {len(items)} 条消息")
+
+    def _dispatch_batch(self, batch: _TopicBatch, items: list):
+        """在工作线程中处理一批消息"""
+        callback_batch = batch.callback_batch
+        if callback_batch is None:
+            for client, userdata, msg in items:
+                batch.dispatch(client, userdata, msg)
             return
+
+        begin_time = time.perf_counter()
+        client, userdata, _ = items[0]
+        msgs = [msg for _, _, msg in items]
         try:
-            result: Result[bool, str] = callback(
-                client, userdata, msg
-            )  # 调用 Callback 中的 callback() 函数
+            result: Result[bool, str] = callback_batch(client, userdata, msgs)
+            if result.is_ok():
+                logger.debug(
+                    "Callback {} 批处理成功 ({} 条): Result.value{} 执行耗时: {} 单位: 秒",
+                    batch.callback_path,
+                    len(msgs),
+                    result.unwrap(),
+                    time.perf_counter() - begin_time,
+                )
+            else:
+                logger.warning(
+                    f"Callback {batch.callback_path} 批处理失败: Result Err {result.error}"
+                )
         except Exception as e:
             logger.warning(
-                f"Callback {topic_config['callback_path']} 执行失败: raise error {e}"
+                f"Callback {batch.callback_path} 批处理失败: raise error {e!r}"
             )
-            return
-        if result.is_ok():
-            logger.info(f"Callback {topic_config['callback_path']} 执行成功")
-            v = result.unwrap()
-            logger.info(
-                f"Callback {topic_config['callback_path']} 执行结果: Result.value{v}"
-            )
-        else:
-            logger.warning(
-                f"Callback {topic_config['callback_path']} 执行失败: Result Err {result.error}"
-            )
-        end_time = time.time()
-        logger.info(
-            f"Callback {topic_config['callback_path']} 执行耗时: {end_time - begin_time} 单位: 秒"
-        )
 
     def _sync_subscriptions(self):
         """同步订阅状态：新增/取消 Topic"""
-        current_topics = set(self.config.get("topics", {}).keys())
+        # 配置错误的 Topic 视为未配置，不能让异常中断主循环
+        topics = {
+            topic: cfg
+            for topic, cfg in self.config.get("topics", {}).items()
+            if self._validate_topic_config(topic, cfg)
+        }
+        current_topics = set(topics.keys())
+        # 移除不再使用的 Callback 的监听记录，避免其 dirty 标记持续唤醒主循环
+        self._active_callback_paths = {cfg["callback_path"] for cfg in topics.values()}
+        for callback_path in list(self._callback_dirty):
+            if callback_path not in self._active_callback_paths:
+                self._unwatch_callback(callback_path)
+        # 重新生成 Topic 专用处理函数（未变更的 Callback 直接命中缓存）
+        batched_topics = set()
+        for topic, cfg in topics.items():
+            callback_path = cfg["callback_path"]
+            callback_func, _, callback_batch, callback_json = self._load_callback(
+                callback_path
+            )
+            dispatch = self._make_dispatch(callback_func, callback_json, callback_path)
+            batch = None
+            if cfg.get("batch_size"):
+                batched_topics.add(topic)
+                batch = self._topic_batches.get(topic)
+                if batch is None:
+                    batch = self._topic_batches[topic] = _TopicBatch(topic)
+                batch.size = cfg["batch_size"]
+                batch.window = cfg.get("batch_window_ms", DEFAULT_BATCH_WINDOW_MS) / 1000
+                batch.callback_batch = callback_batch
+                batch.callback_path = callback_path
+                batch.dispatch = dispatch
+            # 由 paho 按 Topic 直接分发，不再经过统一的 on_message
+            self.client.message_callback_add(
+                topic, self._make_handler(topic, dispatch, batch)
+            )
+        for topic in set(self._topic_batches) - batched_topics:
+            # 不再批处理的 Topic，先处理完缓冲区中剩余的消息
+            self._flush_batch(self._topic_batches.pop(topic))
         # 取消已删除的 Topic
         for topic in self.subscribed_topics - current_topics:
             self.client.unsubscribe(topic)
             self.subscribed_topics.remove(topic)
+            self.client.message_callback_remove(topic)
             logger.info(f"取消订阅: {topic}")
         # 订阅新增的 Topic
         for topic in current_topics - self.subscribed_topics:
-            qos = self.config["topics"][topic].get("qos", 0)
+            qos = topics[topic].get("qos", 0)
             self.client.subscribe(topic, qos)
             self.subscribed_topics.add(topic)
             logger.info(f"订阅: {topic} (QoS={qos})")
 
     def run(self):
         """主循环：检测配置和 Handler 更新，同步订阅"""
-        while True:
-            # 检查配置文件是否更新
-            if os.path.getmtime(self.config_path) > self.last_config_mtime:
-                logger.info("\n配置文件已更新，重新加载...")
-                self.config = self._load_config()
-                self.last_config_mtime = os.path.getmtime(self.config_path)
-
-            # 同步订阅
+        try:
             self._sync_subscriptions()
+            while True:
+                # 等待文件变更通知，最长等待一个检查间隔
+                self._wake.wait(timeout=self.config.get("interval", 5))
+                self._wake.clear()
+
+                # 检查配置文件是否更新
+                config_dirty = self._config_dirty
+                if config_dirty:
+                    self._config_dirty = False
+                    logger.info("\n配置文件已更新，重新加载...")
+                    try:
+                        self.config = self._load_config()
+                    except (OSError, ValueError) as e:
+                        # 变更通知可能在文件写入过程中到达，保留旧配置，等待下一次通知
+                        logger.warning(f"加载配置文件失败，继续使用旧配置: {e}")
+                        config_dirty = False
 
-            # 等待检查间隔
-            time.sleep(self.config.get("interval", 5))
+                # 配置或 Callback 有变更时才同步订阅
+                if config_dirty or any(
+                    self._callback_dirty.get(path) for path in self._active_callback_paths
+                ):
+                    self._sync_subscriptions()
+        finally:
+            self._observer.stop()
+            self._observer.join()
+            self._pool.shutdown(wait=False)
 
 
 if __name__ == "__main__":
     # 确保 handlers 目录存在
     os.makedirs("callback", exist_ok=True)
+    # 日志由后台线程写出，避免在 MQTT 网络线程上做 I/O
+    logger.remove()
+    logger.add(sys.stderr, level=os.environ.get("LOGURU_LEVEL", "INFO"), enqueue=True)
     client = MQTTDatabaseBridge()
     client.run()
@@ -8,6 +8,8 @@ E = TypeVar('E')  # 错误类型
 
 class Ok(Generic[T]):
     """表示操作成功的结果，类似 Rust 的 Ok(T)"""
+    __slots__ = ('value',)
+
     def __init__(self, value: T):
         self.value = value
 
@@ -35,6 +37,8 @@ class Ok(Generic[T]):
 
 class Err(Generic[E]):
     """表示操作失败的结果，类似 Rust 的 Err(E)"""
+    __slots__ = ('error',)
+
     def __init__(self, error: E):
         self.error = error
 
@@ -61,4 +65,8 @@ class Err(Generic[E]):
 
 
 # 定义 Result 类型，为 Ok 和 Err 的联合类型
-Result = Ok[T] | Err[E]
\ No newline at end of file
+Result = Ok[T] | Err[E]
+
+# 常用结果的单例，避免每条消息都分配新的 Ok 对象
+OK_TRUE: Ok[bool] = Ok(True)
+OK_FALSE: Ok[bool] = Ok(False)
\ No newline at end of file